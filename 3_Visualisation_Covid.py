@@ -1,9 +1,13 @@
 """Importing the required libraries"""
 
-from bs4 import BeautifulSoup
+from io import StringIO
+import time
+
 import requests
 import numpy as np
 import pandas as pd
+import pycountry
+from selectolax.lexbor import LexborHTMLParser
 
 # import plotly.offline as pyo
 import plotly.graph_objs as go
@@ -12,92 +16,82 @@ import plotly.express as px
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash import Patch
+from dash.dependencies import Input, Output, State
+from flask_caching import Cache
+from flask_compress import Compress
 
 """Building the functions required to scrape the website"""
 
 
 # ---------------------------------------------------------------------------
 
-def get_country_data(country_line):
-    """
-    This function formats a given input line parsed from an html page.
-
-    Parameters:
-        country_line : str
-            it is a row table row, that contains the data.
-
-    Returns:
-        line : list
-            A list containing all the useful information retrieved.
-    """
-    import re
-    line = country_line.strip().split("\n")
-    line.pop(0)
-    for i, element in zip(range(len(line)), line):
-        if re.search("[1-9]+", element):
-            line[i] = float(''.join(line[i].strip('+').split(",")))
-        else:
-            pass
-
-    return line[:-1]
-
-
-def get_column_names(tr):
-    """
-    This function return a well formatted list for the column names.
-    """
-    line = tr.strip("\n#").strip().split("\n")
-    line[12] += line[13]
-    line.pop(14)
-    line.pop(13)
-    return line[1:-1]
-
-
 def scrape_corona_data():
     """
-    This function scrapes the data from the target website and returns a well formatted dict that contains information about every given country.
+    This function scrapes the data from the target website and returns a dataframe that contains information about every given country.
     """
-    from collections import \
-        defaultdict  # Importing the defaultdict model, that will be used to store the information while scraping the website
-    countries_data = defaultdict(dict)
     coronameter = requests.get(
         "https://www.worldometers.info/coronavirus/")  # requesting the index page from the server, it is also where our information resides
-    bscorona = BeautifulSoup(coronameter.text, "lxml")  # parsing the webpage to a beautifulsoup object.
-    corona_table = bscorona.find("table",
-                                 id="main_table_countries_today")  # selecting the table where our data is contained.
-    # print(corona_table.tr.text)
-    column_names = get_column_names(corona_table.tr.text)
-    # print(column_names)
-    for tr in corona_table.find_all("tr", {"style": ""})[2:-2]:
-        line = get_country_data(tr.text)
-        countries_data[line[0]] = dict(zip(column_names, line[1:]))
+    # selecting the table where our data is contained, only this table is then parsed into a dataframe.
+    corona_table = LexborHTMLParser(coronameter.text).css_first('#main_table_countries_today')
+    # The headers are split with <br> tags, e.g. "Total<br>Cases", which read_html would read as "Total Cases".
+    # The tags are removed so that the columns keep their usual names, e.g. "TotalCases".
+    # The continents are in hidden cells, displayed_only=False keeps them.
+    countries_data = pd.read_html(StringIO(corona_table.html.replace('<br>', '')), flavor='lxml',
+                                  displayed_only=False)[0]
+    # Only the countries are ranked, this drops the continents rows as well as the totals rows.
+    countries_data = countries_data[countries_data['#'].notna()
+                                    & ~countries_data['Country,Other'].isin(['World', 'Total:'])]
+    countries_data = countries_data.drop(columns='#').set_index('Country,Other').rename_axis(None)
+    # some headers also span several lines, e.g. "Tests/ 1M pop" is renamed "Tests/1M pop".
+    countries_data.columns = countries_data.columns.str.replace('/ ', '/', regex=False)
+    # "+1,234" like values are converted to numbers, empty or N/A values become np.nan.
+    num_cols = countries_data.columns.drop('Continent')
+    for col in num_cols:
+        # read_html already converted the columns without a sign, the others are cleaned without a regex
+        if not pd.api.types.is_numeric_dtype(countries_data[col]):
+            countries_data[col] = countries_data[col].str.replace(',', '', regex=False).str.lstrip('+')
+    countries_data[num_cols] = countries_data[num_cols].apply(pd.to_numeric, errors='coerce')
     return countries_data
 
 
-def replace_nan(data):
-    """
-    This function replaces empty or N/A values with np.nan so that it can be easier to manipulate the data later on.
-    """
-    for col in data.columns:
-        data[col].replace(["N/A", "", " "], np.nan, inplace=True)
+# The ISO-3 code of every country name known by pycountry, it is built once so that the map does not have to match
+# every country name. Worldometers spells some of the names differently.
+_country_to_iso3_cache = {
+    name: country.alpha_3
+    for country in pycountry.countries
+    for name in (country.name, getattr(country, 'common_name', None), getattr(country, 'official_name', None))
+    if name
+}
+_country_to_iso3_cache.update({
+    'USA': 'USA', 'UK': 'GBR', 'S. Korea': 'KOR', 'DPRK': 'PRK', 'Russia': 'RUS', 'Turkey': 'TUR', 'UAE': 'ARE',
+    'Palestine': 'PSE', 'Brunei': 'BRN', 'DRC': 'COD', 'CAR': 'CAF', 'Ivory Coast': 'CIV',
+    'Faeroe Islands': 'FRO', 'Micronesia': 'FSM', 'Saint Martin': 'MAF', 'Sint Maarten': 'SXM',
+    'Caribbean Netherlands': 'BES', 'St. Vincent Grenadines': 'VCT', 'Turks and Caicos': 'TCA', 'St. Barth': 'BLM',
+    'Saint Pierre Miquelon': 'SPM', 'Saint Helena': 'SHN', 'Falkland Islands': 'FLK', 'Vatican City': 'VAT',
+})
 
 
 def create_clean_dataframe(countries_data):
     """
-    This function takes a dict object and create a clean well formatted dataframe.
+    This function takes the scraped dataframe and create a clean well formatted dataframe.
 
     Parameters:
-        countries_data : dict object
-            The dict that contains the countries data.
+        countries_data : dataframe
+            The dataframe that contains the countries data.
     Returns:
         data : dataframe
             Well formatted dataframe.
     """
-    data = pd.DataFrame(countries_data).transpose()
-    replace_nan(data)
+    data = countries_data
     # Western Sahara is not a country
     data.loc['Western Sahara', :] = data.loc['Morocco', :]
+    # the numeric columns are downcast to float32 only where no value changes, the large counts (e.g. TotalCases,
+    # TotalTests, Population) and the columns with decimals stay float64 so that the exact values are shown
+    num_cols = [col for col in data.columns if col not in ('Continent',)]
+    data[num_cols] = data[num_cols].apply(pd.to_numeric, errors='coerce', downcast='float')
+    # the countries that are not on the map, e.g. the cruise ships, get a missing code
+    data['iso3'] = data.index.map(_country_to_iso3_cache)
     # data.drop(['Western Sahara'], inplace=True)
     # print(data.columns.values)
     return data
@@ -110,12 +104,11 @@ def create_clean_dataframe(countries_data):
 # plot cases in map
 
 def plot_country_map(data, keyword='TotalCases'):
-    data_country = pd.DataFrame(zip(data.index, data[keyword]), columns=['Country', keyword])
-    data_country[keyword].replace(np.nan, 0, inplace=True)
-    fig = px.choropleth(data_country, color=keyword, locationmode='country names',
-                        locations="Country", featureidkey="properties.district",
-                        projection="mercator", scope='world', title='' + keyword + ' by countries'
-                        )
+    fig = go.Figure(go.Choropleth(locations=data['iso3'].to_numpy(), z=data[keyword].fillna(0).to_numpy(),
+                                  locationmode='ISO-3',
+                                  text=data.index, hovertemplate='%{text}<br>' + keyword + '=%{z}<extra></extra>',
+                                  colorbar=dict(title=dict(text=keyword))),
+                    layout=go.Layout(title='' + keyword + ' by countries'))
     fig.update_geos(projection_type="natural earth")
     fig.update_layout(height=500, margin={"r": 0, "t": 0, "l": 0, "b": 0})
     return fig
@@ -140,14 +133,21 @@ def plot_morocco_data(data):
 
 # plot data by country
 
-def plot_pie_data(data, keyword='TotalCases'):
-    data_country = pd.DataFrame(zip(data.index, data[keyword]), columns=['Country', keyword])
-    # get the value of the 10th top-25 country
-    sueil = data_country.nlargest(n=10, columns=[keyword])[keyword].iloc[-1]
+def group_other_countries(data, keyword='TotalCases'):
+    """This function returns the countries names and the keyword values, where the countries outside the top 10 are named 'Other countries'."""
+    values = data[keyword].fillna(0).to_numpy()
+    # get the value of the 10th top country, a single selection pass is enough as the top 10 order is not needed
+    k = min(10, len(values))
+    sueil = -np.partition(-values, k - 1)[k - 1]
     # Represent countries with low value with 'Other countries'
-    data_country.loc[data_country[keyword] < sueil, 'Country'] = 'Other countries'  # Represent only large countries
-    # print(data_country)
-    fig = px.pie(data_country, values=keyword, names='Country', title='' + keyword + ' by countries')
+    names = np.where(values < sueil, 'Other countries', data.index.to_numpy())  # Represent only large countries
+    return names, values
+
+
+def plot_pie_data(data, keyword='TotalCases'):
+    names, values = group_other_countries(data, keyword)
+    fig = px.pie(values=values, names=names, labels={'names': 'Country', 'values': keyword},
+                 title='' + keyword + ' by countries')
     return fig
 
 
@@ -169,43 +169,57 @@ def plot_continent_data(data, keyword):
         cols = ["NewCases", "NewRecovered", "NewDeaths"]
     else:
         cols = ["TotalCases", "TotalRecovered", "TotalDeaths"]
-    # create a new dataframe with Continent and cols
-    new_df = data[['Continent'] + cols]
-
-    # use melt function to transform all cols in one column 'type' and all value in one column 'value
-    df = pd.melt(new_df, id_vars=['Continent'], var_name='type', value_name='value')
+    # sum every col by continent
+    agg = data.groupby('Continent', sort=False)[cols].sum()
 
-    # plot new dataframe with plotly express, use color attribute to group
-    fig = px.bar(df, x='Continent', y='value', color='type', barmode='group')
+    # one bar trace per col, grouped by continent
+    fig = go.Figure([go.Bar(name=col, x=agg.index, y=agg[col]) for col in cols])
+    fig.update_layout(barmode='group')
 
     return fig
 
 
 
-def get_top_k_countries(data, k_countries=10, sortedby="TotalCases", ascending=False):
+def sort_numeric_columns(data):
+    """
+    This function sorts every numeric column once, in a descending order, so that the top countries can be sliced without sorting the data again.
+
+    Parameters:
+        data : dataframe.
+            The whole dataset.
+
+    Returns:
+        sorted_indices : dict
+            The positions of the countries sorted by value for every numeric column, countries with a missing value come last.
+    """
+    return {col: np.argsort(-np.nan_to_num(data[col].to_numpy(), nan=-np.inf), kind='stable')
+            for col in data.select_dtypes(include='number').columns}
+
+
+def get_top_k_countries(data, sorted_indices, k_countries=10, sortedby="TotalCases"):
     """
     This function creates a k-len dataframe sorted by a key.
 
     Parameters:
         data : dataframe.
             The whole dataset.
+        sorted_indices : dict
+            The sorted positions returned by sort_numeric_columns for this dataset.
         k_countries : int, Default=10
             The number of countries you want to plot.
         sortedby : str, Default="TotalCases".
             The column name we want to sort the data by
-        ascending : Boolean, Default=False
-            Either we want to sort in an ascending order or descending order.
 
     Returns:
         data : dataframe
-            The k_contries lines dataframe sortedby the key given and in the wanted order.
+            The k_contries lines dataframe sortedby the key given in a descending order.
     """
-    return data.sort_values(by=sortedby, ascending=ascending).iloc[:k_countries]
+    return data.iloc[sorted_indices[sortedby][:k_countries]]
 
 
 def plot_top_k_countries(n_countries, sortby):
     """This function returns a figure where a number of countries are sorted by the value that resides in sortby."""
-    res = get_top_k_countries(data, n_countries, sortby)
+    res = get_top_k_countries(get_data(), get_sorted_indices(), n_countries, sortby)
     # print('top k', res)
     fig = px.bar(res, x=res.index.to_list(), y=res[sortby])
     return fig
@@ -221,18 +235,58 @@ def plot_boxplots(data, keyword="Deaths/1M pop"):
 
 def init_figure():
     "This function initiate all the needed figure to start the app."
+    data = get_data()
     return plot_country_map(data), \
            plot_morocco_data(data), \
            plot_pie_data(data), \
-           plot_continent_data(data, keyword="New"), \
+           get_continent_figure("New"), \
            plot_top_k_countries(10, "TotalCases"), plot_boxplots(data)
 
 
-"""Initiale Figures"""
+"""Building the app"""
 # ---------------------------------------------------------------------------
 
-countries_data = scrape_corona_data()
-data = create_clean_dataframe(countries_data)
+# Initializing the app
+app = dash.Dash(__name__)
+# some callbacks target graphs that are not in the layout yet
+app.config.suppress_callback_exceptions = True
+server = app.server
+
+# The responses, mostly figures JSON, are gzipped, the smallest ones are not worth it
+server.config['COMPRESS_MIN_SIZE'] = 500
+Compress(server)
+
+# The scraped data and the figures built from it are cached for 5 minutes, so
+# that repeated dropdown selections do not rebuild the same figure again.
+cache = Cache(server, config={'CACHE_TYPE': 'SimpleCache'})
+
+
+@cache.memoize(timeout=300)
+def get_data():
+    """This function returns the clean dataframe, the website is only scraped again once the cache has expired."""
+    data = create_clean_dataframe(scrape_corona_data())
+    # the time of the scrape tells the browsers whether their copy of the data is outdated
+    data.attrs['scraped_at'] = time.time()
+    # the sorted indices and the figures of the previous data are no longer valid
+    for memoized in (get_sorted_indices, get_continent_figure):
+        cache.delete_memoized(memoized)
+    return data
+
+
+@cache.memoize(timeout=300)
+def get_sorted_indices():
+    """This function returns the sorted positions of every numeric column of the current data."""
+    return sort_numeric_columns(get_data())
+
+
+@cache.memoize(timeout=300)
+def get_continent_figure(keyword):
+    """This function returns the serialized continental figure of the keyword."""
+    return plot_continent_data(get_data(), keyword=keyword).to_dict()
+
+
+"""Initiale Figures"""
+# ---------------------------------------------------------------------------
 
 init_map_fig, \
 init_morocco_fig, \
@@ -241,13 +295,6 @@ init_continent_fig, \
 init_k_countries_plot, \
 init_box_fig = init_figure()
 
-"""Building the app"""
-# ---------------------------------------------------------------------------
-
-# Initializing the app
-app = dash.Dash(__name__)
-server = app.server
-
 # Building the app layout
 app.layout = html.Div([
 html.Div([
@@ -304,7 +351,12 @@ html.Div([
                      value="TotalCases",
                      style={"width": "60%"}
                      ),
-        dcc.Graph(id="by_countries_pie", figure=init_pie_fig)
+        dcc.Graph(id="by_countries_pie", figure=init_pie_fig),
+        # the whole dataset is sent to the browser so that the pie chart can be updated there,
+        # it is sent once per page load and then only when the data has been scraped again
+        dcc.Store(id="raw"),
+        dcc.Store(id="raw_scraped_at"),
+        dcc.Interval(id="refresh_raw", interval=300 * 1000)
     ]),
 
 
@@ -318,7 +370,16 @@ html.Div([
     Input("select_attribute_map", "value")
 )
 def update_map_data(value):
-    return plot_country_map(data, keyword=value)
+    # Only the values and the titles are sent back, the rest of the initial figure is left untouched
+    data = get_data()
+    map_patch = Patch()
+    map_patch['data'][0]['locations'] = data['iso3'].tolist()
+    map_patch['data'][0]['text'] = data.index.tolist()
+    map_patch['data'][0]['z'] = data[value].fillna(0).tolist()
+    map_patch['data'][0]['hovertemplate'] = '%{text}<br>' + value + '=%{z}<extra></extra>'
+    map_patch['data'][0]['colorbar']['title']['text'] = value
+    map_patch['layout']['title']['text'] = value + ' by countries'
+    return map_patch
 
 
 @app.callback(
@@ -326,14 +387,51 @@ def update_map_data(value):
     Input("select_attribute_morocco", "value")
 )
 def update_morocco_data(value):
-    return plot_morocco_data(data, keyword=value)
+    return plot_morocco_data(get_data(), keyword=value)
 
 @app.callback(
+    Output("raw", "data"),
+    Output("raw_scraped_at", "data"),
+    Input("refresh_raw", "n_intervals"),
+    State("raw_scraped_at", "data")
+)
+def update_raw_data(n_intervals, scraped_at):
+    data = get_data()
+    # the browser already has this data
+    if data.attrs['scraped_at'] == scraped_at:
+        return dash.no_update, dash.no_update
+    return data.reset_index().to_dict('records'), data.attrs['scraped_at']
+
+
+# The pie chart is rebuilt in the browser from the stored dataset, the same way as plot_pie_data
+app.clientside_callback(
+    """
+    function(value, raw, figure) {
+        // the initial figure is kept until the dataset has been received
+        if (raw == null) {
+            return window.dash_clientside.no_update;
+        }
+        // missing values count as 0
+        var values = raw.map(function(row) { return row[value] == null ? 0 : row[value]; });
+        // get the value of the 10th top country
+        var sorted = values.slice().sort(function(a, b) { return b - a; });
+        var sueil = sorted[Math.min(9, sorted.length - 1)];
+        // Represent countries with low value with 'Other countries'
+        var labels = raw.map(function(row, i) { return values[i] < sueil ? 'Other countries' : row['index']; });
+        var trace = Object.assign({}, figure.data[0], {
+            labels: labels,
+            values: values,
+            hovertemplate: 'Country=%{label}<br>' + value + '=%{value}<extra></extra>'
+        });
+        var title = Object.assign({}, figure.layout.title, {text: value + ' by countries'});
+        return Object.assign({}, figure, {data: [trace], layout: Object.assign({}, figure.layout, {title: title})});
+    }
+    """,
     Output("by_countries_pie", "figure"),
-    Input("select_attribute_pie", "value")
+    Input("select_attribute_pie", "value"),
+    Input("raw", "data"),
+    State("by_countries_pie", "figure")
 )
-def update_pie_data(value):
-    return plot_pie_data(data, keyword=value)
 
 
 @app.callback(
@@ -341,7 +439,7 @@ def update_pie_data(value):
     Input("select_keyword", "value")
 )
 def update_continent_corona_bar(value):
-    return plot_continent_data(data, keyword=value)
+    return get_continent_figure(value)
 
 
 @app.callback(
@@ -357,10 +455,14 @@ def update_k_countries_sorted(attribute, n_countries):
     Input("select_box_attribute", "value")
 )
 def update_continent_box_plot(value):
-    return plot_boxplots(data, keyword=value)
+    data = get_data()
+    box_patch = Patch()
+    box_patch['data'][0]['x'] = data['Continent'].tolist()
+    box_patch['data'][0]['y'] = data[value].tolist()
+    box_patch['data'][0]['hovertemplate'] = 'Continent=%{x}<br>' + value + '=%{y}<extra></extra>'
+    box_patch['layout']['yaxis']['title']['text'] = value
+    return box_patch
 
 
 if __name__ == "__main__":
-    countries_data = scrape_corona_data()
-    data = create_clean_dataframe(countries_data)
     app.run_server()
@@ -1,58 +1,110 @@
+import asyncio
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
+import numpy as np
+import pandas as pd
+from numba import njit
 import plotly.graph_objs as go
 import dash
 import dash_html_components as html
 import dash_core_components as dcc
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 from wordcloud import WordCloud
 
 # Define the color palette
 colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
           '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
 
-def scrape_imdb_movie_data():
+def fetch_pages(urls):
+    # All the pages are requested concurrently over a single keep-alive session
+    with requests.Session() as session:
+        session.mount('https://', HTTPAdapter(pool_connections=8, pool_maxsize=8))
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            return list(executor.map(lambda url: session.get(url).text, urls))
+
+
+def can_use_http2():
+    # httpx needs the optional h2 package for HTTP/2, and asyncio.run cannot be called from a running event loop
+    if importlib.util.find_spec('httpx') is None or importlib.util.find_spec('h2') is None:
+        return False
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return True
+    return False
+
+
+async def fetch_pages_http2(urls):
+    import httpx
+
+    # All the pages are multiplexed as HTTP/2 streams over a single connection
+    async with httpx.AsyncClient(http2=True, timeout=10, follow_redirects=True) as client:
+        responses = await asyncio.gather(*(client.get(url) for url in urls))
+    return [response.text for response in responses]
+
+
+def scrape_imdb_movie_data(use_http2=True):
     link = "https://www.imdb.com/search/title?release_date=2018-01-01,2018-12-31&sort=boxoffice_gross_us,desc&start="
     target_count = 100  # Set the number of movies you want to scrape
 
+    # IMDB lists 50 movies per page, start is the rank of the first movie of a page
+    urls = [link + str(start) for start in range(1, target_count + 1, 50)]
+
     movie_data = []
-    page_number = 1
 
-    while len(movie_data) < target_count:
-        url = link + str(page_number)
-        source = requests.get(url).text
-        soup = BeautifulSoup(source, 'html.parser')
-        movie_blocks = soup.find_all('div', class_='lister-item-content')
+    # all the pages are sent over one HTTP/2 connection, the thread pool is used when HTTP/2 is not available or use_http2=False
+    sources = asyncio.run(fetch_pages_http2(urls)) if use_http2 and can_use_http2() else fetch_pages(urls)
+
+    for source in sources:
+        tree = LexborHTMLParser(source)
+        movie_blocks = tree.css('div.lister-item-content')
 
         for block in movie_blocks:
-            title = block.find('a').text
-            rating = block.find('strong').text
-            genres = block.find('span', class_='genre').text.strip().split(', ')
-            director = block.find('p', class_='').find_all('a')[0].text
-            actors = [actor.text for actor in block.find('p', class_='').find_all('a')[1:]]
+            title = block.css_first('a').text()
+            rating = block.css_first('strong').text()
+            genres = block.css_first('span.genre').text().strip().split(', ')
+            # the first paragraph without a class lists the director followed by the actors
+            people = next(p for p in block.css('p') if not p.attributes.get('class')).css('a')
+            director, actors = people[0].text(), [actor.text() for actor in people[1:]]
 
             movie_data.append({'Title': title, 'Rating': rating, 'Genres': genres, 'Director': director, 'Actors': actors})
 
-        page_number += 1
+    return movie_data[:target_count]
 
-    return movie_data
 
+def create_movies_dataframe(movie_data):
+    movies_df = pd.DataFrame(movie_data)
+    movies_df['Rating'] = pd.to_numeric(movies_df['Rating'], errors='coerce')
+    return movies_df
 
-def create_top_rated_genres_bar_chart(movie_data):
-    genre_ratings = {}
 
-    for movie in movie_data:
-        rating = float(movie['Rating'])
-        for genre in movie['Genres']:
-            if genre not in genre_ratings:
-                genre_ratings[genre] = []
-            genre_ratings[genre].append(rating)
+@njit(cache=True)
+def groupby_mean(codes, values, n_groups):
+    # Mean of the values of every group, missing values and missing groups are skipped
+    sums = np.zeros(n_groups, np.float64)
+    counts = np.zeros(n_groups, np.int64)
+    for i in range(len(codes)):
+        if codes[i] >= 0 and not np.isnan(values[i]):
+            sums[codes[i]] += values[i]
+            counts[codes[i]] += 1
+    return sums / counts
 
-    top_rated_genres = sorted(genre_ratings, key=lambda x: sum(genre_ratings[x]) / len(genre_ratings[x]), reverse=True)[:10]
+
+def create_top_rated_genres_bar_chart(movies_df):
+    movie_genres = movies_df.explode('Genres')
+    codes, genres = pd.factorize(movie_genres['Genres'])
+    genre_ratings = groupby_mean(codes.astype(np.int32), movie_genres['Rating'].to_numpy(), len(genres))
+    # genres without any rating are left out
+    rated_genres = np.flatnonzero(~np.isnan(genre_ratings))
+    top_rated_genres = rated_genres[np.argsort(-genre_ratings[rated_genres], kind='stable')[:10]]
 
     data = [
         go.Bar(
-            x=top_rated_genres,
-            y=[sum(genre_ratings[genre]) / len(genre_ratings[genre]) for genre in top_rated_genres],
+            x=genres[top_rated_genres],
+            y=genre_ratings[top_rated_genres],
             marker=dict(color='rgb(158,202,225)'),
             name='Average Rating'
         )
@@ -68,22 +120,13 @@ def create_top_rated_genres_bar_chart(movie_data):
     return fig
 
 
-def create_favorite_directors_bar_chart(movie_data):
-    director_ratings = {}
-
-    for movie in movie_data:
-        rating = float(movie['Rating'])
-        director = movie['Director']
-        if director not in director_ratings:
-            director_ratings[director] = []
-        director_ratings[director].append(rating)
-
-    top_rated_directors = sorted(director_ratings, key=lambda x: sum(director_ratings[x]) / len(director_ratings[x]), reverse=True)[:10]
+def create_favorite_directors_bar_chart(movies_df):
+    top_rated_directors = movies_df.groupby('Director', sort=False)['Rating'].mean().nlargest(10)
 
     data = [
         go.Bar(
-            y=top_rated_directors,
-            x=[sum(director_ratings[director]) / len(director_ratings[director]) for director in top_rated_directors],
+            y=top_rated_directors.index,
+            x=top_rated_directors.values,
             orientation='h',
             marker=dict(color='rgb(158,202,225)'),
             name='Average Rating'
@@ -141,16 +184,12 @@ def create_movie_titles_wordcloud(movie_data):
     return fig
 
 def create_cumulative_rating_area_chart(movie_data):
-    sorted_movies = sorted(movie_data, key=lambda x: x['Rating'], reverse=True)
+    sorted_movies = sorted(movie_data, key=lambda x: float(x['Rating']), reverse=True)
     movie_titles = [movie['Title'] for movie in sorted_movies]
-    ratings = [float(movie['Rating']) for movie in sorted_movies]
-
-    cumulative_ratings = []
-    cumulative_rating = 0
+    ratings = np.fromiter((float(movie['Rating']) for movie in sorted_movies), dtype=np.float32,
+                          count=len(sorted_movies))
 
-    for rating in ratings:
-        cumulative_rating += rating
-        cumulative_ratings.append(cumulative_rating)
+    cumulative_ratings = np.cumsum(ratings)
 
     data = [
         go.Scatter(
@@ -172,17 +211,11 @@ def create_cumulative_rating_area_chart(movie_data):
     fig = go.Figure(data=data, layout=layout)
     return fig
 
-def create_genre_distribution_pie_chart(movie_data):
-    genre_counts = {}
+def create_genre_distribution_pie_chart(movies_df):
+    genre_counts = movies_df.explode('Genres')['Genres'].value_counts()
 
-    for movie in movie_data:
-        for genre in movie['Genres']:
-            if genre not in genre_counts:
-                genre_counts[genre] = 0
-            genre_counts[genre] += 1
-
-    genre_labels = list(genre_counts.keys())
-    genre_values = list(genre_counts.values())
+    genre_labels = genre_counts.index
+    genre_values = genre_counts.values
 
     fig = go.Figure(data=[go.Pie(
         labels=genre_labels,
@@ -203,12 +236,13 @@ def create_genre_distribution_pie_chart(movie_data):
 
 # Call the scraping function
 movie_data = scrape_imdb_movie_data()
+movies_df = create_movies_dataframe(movie_data)
 
 # Create the bar chart figure for top-rated genres
-bar_chart_fig = create_top_rated_genres_bar_chart(movie_data)
-genre_distribution_pie_chart_fig = create_genre_distribution_pie_chart(movie_data)
+bar_chart_fig = create_top_rated_genres_bar_chart(movies_df)
+genre_distribution_pie_chart_fig = create_genre_distribution_pie_chart(movies_df)
 # Create the bar chart figure for favorite directors
-directors_bar_chart_fig = create_favorite_directors_bar_chart(movie_data)
+directors_bar_chart_fig = create_favorite_directors_bar_chart(movies_df)
 
 # Create the scatter plot figure for movie ratings
 scatter_plot_fig = create_movie_ratings_scatter_plot(movie_data)
@@ -216,6 +250,9 @@ scatter_plot_fig = create_movie_ratings_scatter_plot(movie_data)
 # Create the area chart figure for cumulative rating over time
 area_chart_fig = create_cumulative_rating_area_chart(movie_data)
 
+# Create the word cloud figure of the movie titles, it is rendered only once
+wordcloud_fig = create_movie_titles_wordcloud(movie_data)
+
 
 
 # Create a Dash app
@@ -234,7 +271,7 @@ app.layout = html.Div(
 
         ),dcc.Graph(
             id='wordcloud',
-            figure=create_movie_titles_wordcloud(movie_data)
+            figure=wordcloud_fig
         ),dcc.Graph(
             id='directors-bar-chart',
             figure=directors_bar_chart_fig